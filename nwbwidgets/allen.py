@@ -1,5 +1,3 @@
-from typing import Iterable
-
 import numpy as np
 
 from pynwb.misc import Units
@@ -7,6 +5,7 @@ import ipywidgets as widgets
 
 from .misc import RasterWidget, PSTHWidget, RasterGridWidget
 from .view import default_neurodata_vis_spec
+from .utils.dynamictable import memoize_by_table, get_soa, has_variation
 from .utils.pynwb import robust_unique
 from .controllers import GroupAndSortController
 
@@ -34,10 +33,10 @@ class AllenPSTHWidget(PSTHWidget):
         return self.units.get_ancestor('NWBFile').epochs
 
     def stimulus_type_dd_callback(self, change):
-        self.gas.discard_rows = np.where(self.trials['stimulus_name'][:] != self.stimulus_type_dd.value)[0]
+        self.gas.discard_rows = np.where(get_soa(self.trials)['stimulus_name'] != self.stimulus_type_dd.value)[0]
 
     def make_group_and_sort(self, window=False):
-        discard_rows = np.where(self.trials['stimulus_name'][:] != 'drifting_gratings')[0]
+        discard_rows = np.where(get_soa(self.trials)['stimulus_name'] != 'drifting_gratings')[0]
         gas = GroupAndSortController(self.trials, window=window, start_discard_rows=discard_rows)
 
         return gas
@@ -48,29 +47,72 @@ class AllenRasterGroupAndSortController(GroupAndSortController):
     def get_groups(self):
 
         self.electrodes = self.dynamic_table.get_ancestor('NWBFile').electrodes
+        self.electrode_rows = None
 
-        groups = super().get_groups()
-        groups.update({name: np.unique(self.electrodes[name][:]) for name in self.electrodes.colnames})
+        groups = dict(super().get_groups())
+        groups.update(get_electrodes_groups(self.electrodes))
         return groups
 
     def get_orderable_cols(self):
         units_orderable_cols = super().get_orderable_cols()
-        candidate_cols = [x for x in self.electrodes.colnames
-                          if not (isinstance(self.electrodes[x][0], Iterable) or
-                                  isinstance(self.electrodes[x][0], str))]
-        return units_orderable_cols + [x for x in candidate_cols
-                                       if len(robust_unique(self.electrodes[x][:])) > 1]
+        return units_orderable_cols + get_electrodes_orderable_cols(self.electrodes)
 
     def get_group_vals(self, by, rows_select=()):
         if by is None:
             return None
         elif by in self.dynamic_table:
-            return self.dynamic_table[by][:][rows_select]
+            return get_soa(self.dynamic_table)[by][rows_select]
         else:
             if self.electrodes is not None and by in self.electrodes:
-                ids = self.electrodes.id[:]
-                inds = [np.argmax(ids == val) for val in self.dynamic_table['peak_channel_id'][:]]
-                return self.electrodes[by][:][inds][rows_select]
+                inds = self._peak_channel_to_electrode_row()
+                return get_soa(self.electrodes)[by][inds][rows_select]
+
+    def _peak_channel_to_electrode_row(self):
+        """Row of the electrodes table for the peak channel of each unit. Computed once per controller"""
+        if self.electrode_rows is None:
+            peak_ids = get_soa(self.dynamic_table)['peak_channel_id'].astype(np.int64)
+            lut = get_electrode_id_lut(self.electrodes)
+            if lut is not None:
+                inds = np.full(len(peak_ids), -1, dtype=np.int32)
+                in_lut = (peak_ids >= 0) & (peak_ids < len(lut))
+                inds[in_lut] = np.take(lut, peak_ids[in_lut])
+            else:
+                id_to_row = get_electrode_id_to_row(self.electrodes)
+                inds = np.fromiter((id_to_row.get(x, -1) for x in peak_ids.tolist()), dtype=np.int64,
+                                   count=len(peak_ids))
+            if np.any(inds < 0):
+                raise ValueError('peak_channel_id {} not found in electrodes'.format(peak_ids[inds < 0][0]))
+            self.electrode_rows = inds
+        return self.electrode_rows
+
+
+@memoize_by_table
+def get_electrode_id_lut(electrodes):
+    """Dense lookup table from electrode id to electrodes row, with -1 for ids that are not used. None if the ids are
+    negative or too large for a dense table"""
+    ids = np.asarray(electrodes.id[:], dtype=np.int64)
+    if not len(ids) or ids.min() < 0 or ids.max() >= 4 << 20:  # keep the table under 16 MB
+        return None
+    lut = np.full(ids.max() + 1, -1, dtype=np.int32)
+    lut[ids] = np.arange(len(ids), dtype=np.int32)
+    return lut
+
+
+@memoize_by_table
+def get_electrode_id_to_row(electrodes):
+    return {int(x): i for i, x in enumerate(electrodes.id[:])}
+
+
+@memoize_by_table
+def get_electrodes_groups(electrodes):
+    return {name: robust_unique(vals) for name, vals in get_soa(electrodes).items() if len(vals)}
+
+
+@memoize_by_table
+def get_electrodes_orderable_cols(electrodes):
+    soa = get_soa(electrodes)
+    candidate_cols = [x for x in soa if soa[x].dtype.kind in 'biufc']
+    return [x for x in candidate_cols if has_variation(soa[x])]
 
 
 class AllenRasterGridWidget(RasterGridWidget):
@@ -84,7 +126,7 @@ class AllenRasterGridWidget(RasterGridWidget):
         self.children = list(self.children) + [self.controls['trials_select']]
 
     def process_controls(self, control_states):
-        control_states['trials_select'] = self.trials['stimulus_name'][:] == control_states.pop('trials_select')
+        control_states['trials_select'] = get_soa(self.trials)['stimulus_name'] == control_states.pop('trials_select')
         return control_states
 
 
@@ -2,7 +2,7 @@ import numpy as np
 import scipy
 
 
-def compute_smoothed_firing_rate(spike_times, tt, sigma_in_secs):
+def compute_smoothed_firing_rate(spike_times, tt, sigma_in_secs, dtype=float):
     """ Evaluate gaussian smoothing of spike_times at uniformly spaced array t
         Args:
           spike_times:
@@ -11,14 +11,46 @@ def compute_smoothed_firing_rate(spike_times, tt, sigma_in_secs):
               1D array, uniformly spaced, e.g. the output of np.linspace or np.arange
           sigma_in_secs:
               standard deviation of the smoothing gaussian in seconds
+          dtype:
+              dtype of the smoothing, e.g. np.float32 to halve memory traffic. default float
         Returns:
               Gaussian smoothing evaluated at array t
         """
-    binned_spikes = np.zeros_like(tt)
-    binned_spikes[np.searchsorted(tt, spike_times)] += 1
+    return compute_smoothed_firing_rates([spike_times], tt, sigma_in_secs, dtype=dtype)[0]
+
+
+def compute_smoothed_firing_rates(data, tt, sigma_in_secs, dtype=float):
+    """ Evaluate gaussian smoothing of the spike times of many trials at uniformly spaced array tt. All trials are
+        binned in one pass over the concatenated spike times and filtered in a single call
+        Args:
+          data:
+              A list of 1D numpy ndarrays of spike times, one per trial
+          tt:
+              1D array, uniformly spaced, e.g. the output of np.linspace or np.arange
+          sigma_in_secs:
+              standard deviation of the smoothing gaussian in seconds
+          dtype:
+              dtype of the smoothing, e.g. np.float32 to halve memory traffic. default float
+        Returns:
+              2D array (n_trials, len(tt)) of the gaussian smoothing of each trial evaluated at array tt
+        """
+    ntt = len(tt)
+    trial_lengths = [len(x) for x in data]
+    if sum(trial_lengths):
+        spike_times = np.concatenate(data)
+    else:
+        spike_times = np.empty(0)
+    trial_inds = np.repeat(np.arange(len(data)), trial_lengths)
+
+    bins = np.searchsorted(tt, spike_times)
+    in_range = bins < ntt
+    binned_spikes = np.bincount(trial_inds[in_range] * ntt + bins[in_range],
+                                minlength=len(data) * ntt).reshape(len(data), ntt).astype(dtype)
+
     dt = np.diff(tt[:2])[0]
     sigma_in_samps = sigma_in_secs / dt
-    smooth_fr = scipy.ndimage.gaussian_filter1d(binned_spikes, sigma_in_samps) / dt
+    smooth_fr = scipy.ndimage.gaussian_filter1d(binned_spikes, sigma_in_samps, axis=1)
+    smooth_fr /= dt  # in place, so that a float64 dt does not promote a float32 result
     return smooth_fr
 
 
@@ -131,11 +163,8 @@ def psth(data=None, sig=0.05, T=None, err=2, t=None, num_bootstraps=10):
     t_extended = np.linspace(t_min, t_max, num_points_extended)
     smooth_fr_index = np.rint((t-t_min)/(t_extended[1]-t_extended[0])).astype(np.int)
     # evaluate kernel density estimation at array t
-    RR = np.zeros((num_t, num_points))
-    for n in range(num_t):
-        spike_times = data[n] if not np.ma.is_masked(data[n]) else data[n].compressed()
-        smooth_fr = compute_smoothed_firing_rate(spike_times, t_extended, sig)
-        RR[n, :] = smooth_fr[smooth_fr_index]
+    RR = compute_smoothed_firing_rates([np.ma.compressed(data[n]) for n in range(num_t)], t_extended, sig)
+    RR = RR[:, smooth_fr_index]
 
     # find rate
     R = np.mean(RR, axis=0)
@@ -2,9 +2,7 @@ from ipywidgets import widgets, Layout, ValueWidget, link, HBox
 from ipywidgets.widgets.widget_description import DescriptionWidget
 import numpy as np
 from hdmf.common import DynamicTable
-from .utils.dynamictable import group_and_sort, infer_categorical_columns
-from .utils.pynwb import robust_unique
-from typing import Iterable
+from .utils.dynamictable import group_and_sort, infer_categorical_columns, infer_orderable_columns, get_soa
 
 from tqdm.notebook import tqdm as tqdm_notebook
 
@@ -431,15 +429,12 @@ class GroupAndSortController(AbstractGroupAndSortController):
         if by is None:
             return None
         elif by in self.dynamic_table:
-            return self.dynamic_table[by][:][units_select]
+            return get_soa(self.dynamic_table)[by][units_select]
         else:
             raise ValueError('column {} not in DynamicTable {}'.format(by, self.dynamic_table))
 
     def get_orderable_cols(self):
-        candidate_cols = [x for x in self.units.colnames
-                          if not isinstance(self.units[x][0], Iterable) or
-                          isinstance(self.units[x][0], str)]
-        return [x for x in candidate_cols if len(robust_unique(self.units[x][:])) > 1]
+        return infer_orderable_columns(self.dynamic_table)
 
     def group_and_sort(self):
         if self.group_vals is None and self.order_vals is None:
@@ -1,26 +1,25 @@
+from collections import OrderedDict
+from weakref import finalize
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pynwb
-import scipy
 from ipywidgets import widgets, fixed, FloatProgress
-from matplotlib.collections import PatchCollection
-from matplotlib.patches import Rectangle
+from matplotlib.collections import LineCollection, PolyCollection
 from pynwb.misc import AnnotationSeries, Units, DecompositionSeries
 
 from .controllers import make_trial_event_controller, GroupAndSortController, StartAndDurationController, ProgressBar
-from .utils.dynamictable import infer_categorical_columns
-from .utils.units import get_spike_times, get_max_spike_time, get_min_spike_time, align_by_time_intervals, \
+from .utils.dynamictable import infer_categorical_columns, get_soa, get_table_cache
+from .utils.units import iter_spike_times, get_max_spike_time, get_min_spike_time, align_by_time_intervals, \
     get_unobserved_intervals
 from .utils.mpl import create_big_ax
 from .utils.widgets import interactive_output
-from .analysis.spikes import compute_smoothed_firing_rate
+from .analysis.spikes import compute_smoothed_firing_rates
 
 from ipywidgets import Layout
 
 color_wheel = plt.rcParams['axes.prop_cycle'].by_key()['color']
 
-
 def show_annotations(annotations: AnnotationSeries, **kwargs):
     fig, ax = plt.subplots()
     ax.eventplot(annotations.timestamps, **kwargs)
@@ -61,14 +60,11 @@ def show_session_raster(units: Units, time_window=None, units_window=None, show_
     if order is None:
         order = np.arange(len(units), dtype='int')
 
+    this_iter = iter_spike_times(units, order, time_window)
     if progress_bar:
-        this_iter = ProgressBar(order, desc='reading spike data', leave=False)
+        this_iter = ProgressBar(this_iter, desc='reading spike data', leave=False, total=len(order))
         progress_bar = this_iter.container
-    else:
-        this_iter = order
-    data = []
-    for unit in this_iter:
-        data.append(get_spike_times(units, unit, time_window))
+    data = list(this_iter)
 
     if show_obs_intervals:
         unobserved_intervals_list = get_unobserved_intervals(units, time_window, order)
@@ -300,14 +296,13 @@ def trials_psth(units: pynwb.misc.Units, index, start_label='start_time',
     if trials is None:
         trials = units.get_ancestor('NWBFile').trials
 
-    data = align_by_time_intervals(units, index, trials, start_label, start_label, before, after, order,
-                                   progress_bar=progress_bar)
     # expanded data so that gaussian smoother uses larger window than is viewed
-    expanded_data = align_by_time_intervals(units, index, trials, start_label, start_label,
+    expanded_data = _align_by_trials_cached(units, index, trials, start_label,
                                             before + sigma_in_secs * 4,
                                             after + sigma_in_secs * 4,
-                                            order,
-                                            progress_bar=progress_bar)
+                                            order)
+    # the raster only shows the viewed window, which is a subset of the expanded data
+    data = [x[(x >= -before) & (x < after)] for x in expanded_data]
 
     fig, axs = plt.subplots(2, 1, figsize=(10, 10))
 
@@ -322,27 +317,69 @@ def trials_psth(units: pynwb.misc.Units, index, start_label='start_time',
     return fig
 
 
+def _align_by_trials_cached(units, index, trials, start_label, before, after, order=None):
+    """align_by_time_intervals over the selected trials, and then put in the given trial order. The result is cached
+    with the units table for as long as both tables are alive, keyed on the set of selected trials rather than their
+    order, so regrouping or reordering the same trials reuses the aligned spikes. Returns float32 arrays:
+    trial-aligned times are small, so single precision is plenty for plotting and smoothing.
+
+    Parameters
+    ----------
+    units: pynwb.misc.Units
+    index: int
+    trials: pynwb.epoch.TimeIntervals
+    start_label: str
+    before: float
+    after: float
+    order: array-like of int, optional
+        Trials to return, in order. Default returns every trial
+
+    Returns
+    -------
+    list of np.ndarray
+
+    """
+    units_cache = get_table_cache(units)
+    trials_key = ('_align_by_trials_cached', id(trials))
+    if trials_key not in units_cache:
+        units_cache[trials_key] = OrderedDict()
+        finalize(trials, units_cache.pop, trials_key, None)
+    cache = units_cache[trials_key]
+
+    if order is None:
+        rows = np.arange(len(trials))
+        inds = rows
+    else:
+        rows, inds = np.unique(np.asarray(order, dtype='int') % len(trials), return_inverse=True)
+    key = (index, start_label, before, after, len(trials), rows.tobytes())
+    if key in cache:
+        cache.move_to_end(key)
+    else:
+        aligned = align_by_time_intervals(units, index, trials, start_label, start_label, before, after, rows)
+        cache[key] = [x.astype(np.float32, copy=False) for x in aligned]
+        if len(cache) > 8:
+            cache.popitem(last=False)
+    aligned = cache[key]
+
+    return [aligned[i] for i in inds.ravel()]
+
+
 def show_psth_smoothed(data, ax, before, after, group_inds=None, sigma_in_secs=.05, ntt=1000,
                        align_line_color=(.7, .7, .7)):
 
-    all_data = np.hstack(data)
-    if not len(all_data):
+    nonempty_data = [x for x in data if len(x)]
+    if not nonempty_data:
         return
-    tt = np.linspace(min(all_data), max(all_data), ntt)
-    smoothed = np.array([compute_smoothed_firing_rate(x, tt, sigma_in_secs) for x in data])
+    tt = np.linspace(min(np.min(x) for x in nonempty_data), max(np.max(x) for x in nonempty_data), ntt)
+    smoothed = compute_smoothed_firing_rates(data, tt, sigma_in_secs, dtype=np.float32)
 
     if group_inds is None:
         group_inds = np.zeros((len(smoothed)))
-    group_stats = []
-    for group in range(len(np.unique(group_inds))):
-        this_mean = np.mean(smoothed[group_inds == group], axis=0)
-        err = scipy.stats.sem(smoothed[group_inds == group], axis=0)
-        group_stats.append({'mean': this_mean,
-                            'lower': this_mean - 2 * err,
-                            'upper': this_mean + 2 * err})
-    for stats, color in zip(group_stats, color_wheel):
-        ax.plot(tt, stats['mean'], color=color)
-        ax.fill_between(tt, stats['lower'], stats['upper'], alpha=.2, color=color)
+    means, errs = _group_mean_sem(smoothed, group_inds)
+
+    for this_mean, err, color in zip(means, errs, color_wheel):
+        ax.plot(tt, this_mean, color=color)
+        ax.fill_between(tt, this_mean - 2 * err, this_mean + 2 * err, alpha=.2, color=color)
     ax.set_xlim([-before, after])
     ax.set_ylabel('firing rate (Hz)')
     ax.set_xlabel('time (s)')
@@ -350,6 +387,36 @@ def show_psth_smoothed(data, ax, before, after, group_inds=None, sigma_in_secs=.
     ax.axvline(color=align_line_color)
 
 
+def _group_mean_sem(smoothed, group_inds):
+    """Mean and standard error of the mean (ddof=1, as scipy.stats.sem) of the rows of smoothed in each group, in
+    order of the sorted unique group_inds. Groups of a single row get a NaN error.
+
+    Parameters
+    ----------
+    smoothed: np.ndarray (n_trials, n_time)
+    group_inds: array-like (n_trials,)
+
+    Returns
+    -------
+    means, errs: np.ndarray (n_groups, n_time)
+
+    """
+    # sort trials by group once so that each group is a contiguous block that can be reduced in a single pass
+    order = np.argsort(group_inds, kind='stable')
+    sorted_group_inds = np.asarray(group_inds)[order]
+    starts = np.searchsorted(sorted_group_inds, np.unique(sorted_group_inds))
+    counts = np.diff(np.append(starts, len(order)))[:, np.newaxis]
+    smoothed = smoothed[order]
+
+    # accumulate in double precision to avoid cancellation in the variance
+    means = np.add.reduceat(smoothed, starts, axis=0, dtype=np.float64) / counts
+    sums_of_squares = np.add.reduceat(np.square(smoothed, dtype=np.float64), starts, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        errs = np.sqrt(np.maximum(sums_of_squares - counts * means ** 2, 0) / (counts - 1) / counts)
+
+    return means, errs
+
+
 def plot_grouped_events(data, window, group_inds=None, colors=color_wheel, ax=None, labels=None,
                         show_legend=True, offset=0, unobserved_intervals_list=None, progress_bar=None):
     """
@@ -373,13 +440,18 @@ def plot_grouped_events(data, window, group_inds=None, colors=color_wheel, ax=No
 
     """
 
-    data = np.asarray(data)
     if ax is None:
         fig, ax = plt.subplots(figsize=(12, 6))
     if group_inds is not None:
+        group_inds = np.asarray(group_inds)
         ugroup_inds = np.unique(group_inds)
         handles = []
 
+        # sort rows by group once so that each group is a contiguous slice
+        order = np.argsort(group_inds, kind='stable')
+        sorted_data = [data[k] for k in order]
+        group_bounds = np.append(np.searchsorted(group_inds[order], ugroup_inds), len(order))
+
         if progress_bar is not None:
             this_iter = ProgressBar(enumerate(ugroup_inds), desc='plotting spikes', leave=False, total=len(ugroup_inds))
             progress_bar = this_iter.container
@@ -387,18 +459,15 @@ def plot_grouped_events(data, window, group_inds=None, colors=color_wheel, ax=No
             this_iter = enumerate(ugroup_inds)
 
         for i, ui in this_iter:
-            color = colors[ugroup_inds[i] % len(colors)]
-            lineoffsets = np.where(group_inds == ui)[0] + offset
-            event_collection = ax.eventplot(data[group_inds == ui],
-                                            orientation='horizontal',
-                                            lineoffsets=lineoffsets,
-                                            color=color)
-            handles.append(event_collection[0])
+            color = colors[ui % len(colors)]
+            group_rows = slice(group_bounds[i], group_bounds[i + 1])
+            event_collection = plot_event_rows(sorted_data[group_rows], ax, order[group_rows] + offset, color=color)
+            handles.append(event_collection)
         if show_legend:
             ax.legend(handles=handles[::-1], labels=list(labels[ugroup_inds][::-1]), loc='upper left',
                       bbox_to_anchor=(1.01, 1))
     else:
-        ax.eventplot(data, orientation='horizontal', color='k', lineoffsets=np.arange(len(data)) + offset)
+        plot_event_rows(data, ax, np.arange(len(data)) + offset, color='k')
 
     if unobserved_intervals_list is not None:
         plot_unobserved_intervals(unobserved_intervals_list, ax, offset=offset)
@@ -412,13 +481,55 @@ def plot_grouped_events(data, window, group_inds=None, colors=color_wheel, ax=No
     return ax
 
 
+def plot_event_rows(data, ax, lineoffsets, color='k', linelength=1.):
+    """Draw rows of events as vertical ticks, like a horizontal ax.eventplot, but as a single LineCollection
+    instead of one collection per row.
+
+    Parameters
+    ----------
+    data: array-like
+        event times of each row
+    ax: plt.Axes
+    lineoffsets: array-like
+        y position of each row
+    color: optional
+    linelength: float, optional
+
+    Returns
+    -------
+    matplotlib.collections.LineCollection
+
+    """
+    if len(data):
+        xx = np.concatenate([np.ravel(x) for x in data])
+    else:
+        xx = np.empty(0)
+    yy = np.repeat(lineoffsets, [np.size(x) for x in data])
+
+    segments = np.empty((len(xx), 2, 2))
+    segments[:, :, 0] = xx[:, np.newaxis]
+    segments[:, 0, 1] = yy - linelength / 2
+    segments[:, 1, 1] = yy + linelength / 2
+
+    event_collection = LineCollection(segments, colors=color)
+    ax.add_collection(event_collection)
+
+    return event_collection
+
+
 def plot_unobserved_intervals(unobserved_intervals_list, ax, offset=0, color=(0.85, 0.85, 0.85)):
-    for irow, unobs_intervals in enumerate(unobserved_intervals_list):
-        rects = [Rectangle((i_interval[0], irow - .5 + offset),
-                           i_interval[1] - i_interval[0], 1)
-                 for i_interval in unobs_intervals]
-        pc = PatchCollection(rects, color=color)
-        ax.add_collection(pc)
+    intervals = [np.reshape(unobs_intervals, (-1, 2)) for unobs_intervals in unobserved_intervals_list]
+    rows = np.repeat(np.arange(len(intervals)), [len(x) for x in intervals]) + offset
+    if len(intervals):
+        intervals = np.concatenate(intervals)
+    else:
+        intervals = np.empty((0, 2))
+
+    # corners of one rectangle per interval, all drawn as a single collection
+    verts = np.empty((len(rows), 4, 2))
+    verts[:, :, 0] = intervals[:, [0, 1, 1, 0]]
+    verts[:, :, 1] = rows[:, np.newaxis] + np.array([-.5, -.5, .5, .5])
+    ax.add_collection(PolyCollection(verts, color=color))
 
 
 def show_psth_raster(data, before=0.5, after=2.0, group_inds=None, labels=None, ax=None, show_legend=True,
@@ -480,40 +591,28 @@ def raster_grid(units: pynwb.misc.Units, time_intervals: pynwb.epoch.TimeInterva
     if trials_select is None:
         trials_select = np.ones((len(time_intervals),)).astype('bool')
 
-    if rows_label is not None:
-        row_vals = time_intervals[rows_label][:]
-        urow_vals = np.unique(row_vals[trials_select])
-        if urow_vals.dtype == np.float64:
-            urow_vals = urow_vals[~np.isnan(urow_vals)]
-
-    else:
-        urow_vals = [None]
+    urow_vals, row_inds = _get_label_inds(time_intervals, rows_label, trials_select)
     nrows = len(urow_vals)
 
-    if cols_label is not None:
-        col_vals = time_intervals[cols_label][:]
-        ucol_vals = np.unique(col_vals[trials_select])
-        if ucol_vals.dtype == np.float64:
-            ucol_vals = ucol_vals[~np.isnan(ucol_vals)]
-
-    else:
-        ucol_vals = [None]
+    ucol_vals, col_inds = _get_label_inds(time_intervals, cols_label, trials_select)
     ncols = len(ucol_vals)
 
+    # align all selected trials at once and split them per axis below, rather than reading the unit once per axis
+    selected = np.flatnonzero(trials_select)
+    selected_data = align_by_time_intervals(units, index, time_intervals, align_by, align_by, before, after,
+                                            selected)
+    # position of each trial in selected_data
+    selected_pos = np.full(len(trials_select), -1)
+    selected_pos[selected] = np.arange(len(selected))
+
     fig, axs = plt.subplots(nrows, ncols, sharex=True, sharey=True, squeeze=False, figsize=(10, 10))
     big_ax = create_big_ax(fig)
     for i, row in enumerate(urow_vals):
         for j, col in enumerate(ucol_vals):
             ax = axs[i, j]
-            ax_trials_select = trials_select.copy()
-            if row is not None:
-                ax_trials_select &= row_vals == row
-            if col is not None:
-                ax_trials_select &= col_vals == col
-            ax_trials_select = np.where(ax_trials_select)[0]
+            ax_trials_select = np.flatnonzero((row_inds == i) & (col_inds == j))
             if len(ax_trials_select):
-                data = align_by_time_intervals(units, index, time_intervals, align_by, align_by,
-                                               before, after, ax_trials_select)
+                data = [selected_data[k] for k in selected_pos[ax_trials_select]]
                 show_psth_raster(data, before, after, ax=ax)
                 ax.set_xlabel('')
                 ax.set_ylabel('')
@@ -528,6 +627,23 @@ def raster_grid(units: pynwb.misc.Units, time_intervals: pynwb.epoch.TimeInterva
     return fig
 
 
+def _get_label_inds(time_intervals, label, trials_select):
+    """Unique values of a trials column among the selected trials, and the index of each trial's value in them.
+    Trials that are not selected or have a NaN value get an index of -1."""
+    if label is None:
+        return [None], np.where(trials_select, 0, -1)
+
+    uvals, inds = np.unique(np.asarray(time_intervals[label][:]), return_inverse=True)
+    inds = inds.ravel()
+    keep = np.isin(np.arange(len(uvals)), inds[trials_select])
+    if uvals.dtype == np.float64:
+        keep &= ~np.isnan(uvals)
+    inds = np.where(keep, np.cumsum(keep) - 1, -1)[inds]
+    inds[~trials_select] = -1
+
+    return uvals[keep], inds
+
+
 class RasterGridWidget(widgets.VBox):
 
     def __init__(self, units: Units, unit_index=0):
@@ -586,7 +702,7 @@ class RasterGridWidget(widgets.VBox):
         if group_by is None:
             return None
         elif group_by in dynamic_table:
-            return dynamic_table[group_by][:][units_select]
+            return get_soa(dynamic_table)[group_by][units_select]
         else:
             raise ValueError('{} not found in trials'.format(group_by))
 
@@ -0,0 +1,51 @@
+import numpy as np
+from datetime import datetime
+from dateutil.tz import tzlocal
+from pynwb import NWBFile
+from nwbwidgets.allen import AllenRasterGroupAndSortController, get_electrode_id_lut, get_electrode_id_to_row
+import unittest
+
+
+def make_nwbfile(electrode_ids, peak_channel_ids):
+    nwbfile = NWBFile(session_description='NWBFile for Allen widgets',
+                      identifier='NWB123',
+                      session_start_time=datetime(2017, 4, 3, 11, tzinfo=tzlocal()))
+
+    device = nwbfile.create_device(name='probe')
+    group = nwbfile.create_electrode_group(name='probeA', description='probe A', location='VISp', device=device)
+    for i, electrode_id in enumerate(electrode_ids):
+        nwbfile.add_electrode(id=electrode_id, x=float(i), y=0., z=0., imp=np.nan, location='VISp',
+                              filtering='none', group=group)
+
+    nwbfile.add_unit_column('peak_channel_id', 'id of the electrode with the largest waveform')
+    for i, peak_channel_id in enumerate(peak_channel_ids):
+        nwbfile.add_unit(spike_times=[1. + i, 2. + i], peak_channel_id=peak_channel_id)
+
+    return nwbfile
+
+
+class AllenRasterGroupAndSortControllerTestCase(unittest.TestCase):
+
+    def test_peak_channel_to_electrode_row(self):
+        nwbfile = make_nwbfile(electrode_ids=[7, 3, 12], peak_channel_ids=[12, 3, 7, 3])
+        controller = AllenRasterGroupAndSortController(nwbfile.units)
+
+        assert get_electrode_id_lut(nwbfile.electrodes) is not None
+        np.testing.assert_array_equal(controller._peak_channel_to_electrode_row(), [2, 1, 0, 1])
+        np.testing.assert_array_equal(controller.get_group_vals('x'), [2., 1., 0., 1.])
+
+    def test_peak_channel_missing(self):
+        nwbfile = make_nwbfile(electrode_ids=[7, 3, 12], peak_channel_ids=[12, 5])
+        controller = AllenRasterGroupAndSortController(nwbfile.units)
+
+        with self.assertRaises(ValueError):
+            controller._peak_channel_to_electrode_row()
+
+    def test_peak_channel_large_ids(self):
+        large_id = 5 << 20
+        nwbfile = make_nwbfile(electrode_ids=[7, large_id, 3], peak_channel_ids=[3, large_id, 7])
+        controller = AllenRasterGroupAndSortController(nwbfile.units)
+
+        assert get_electrode_id_lut(nwbfile.electrodes) is None
+        assert get_electrode_id_to_row(nwbfile.electrodes) == {7: 0, large_id: 1, 3: 2}
+        np.testing.assert_array_equal(controller._peak_channel_to_electrode_row(), [2, 1, 0])
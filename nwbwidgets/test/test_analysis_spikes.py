@@ -0,0 +1,37 @@
+import numpy as np
+from nwbwidgets.analysis.spikes import compute_smoothed_firing_rate, compute_smoothed_firing_rates
+
+
+def test_compute_smoothed_firing_rates():
+    tt = np.linspace(0, 1, 101)
+    data = [np.array([.1, .35, .8]), np.array([]), np.array([.5, .52])]
+
+    smoothed = compute_smoothed_firing_rates(data, tt, .05)
+
+    assert smoothed.shape == (3, 101)
+    for x, row in zip(data, smoothed):
+        np.testing.assert_allclose(row, compute_smoothed_firing_rate(x, tt, .05))
+
+
+def test_compute_smoothed_firing_rates_coincident_spikes():
+    tt = np.linspace(0, 1, 101)
+
+    single, double = compute_smoothed_firing_rates([np.array([.5]), np.array([.5, .5])], tt, .05)
+
+    np.testing.assert_allclose(double, 2 * single)
+
+
+def test_compute_smoothed_firing_rates_out_of_range():
+    tt = np.linspace(0, 1, 101)
+
+    in_range, with_out_of_range = compute_smoothed_firing_rates([np.array([.5]), np.array([.5, 2.])], tt, .05)
+
+    np.testing.assert_allclose(with_out_of_range, in_range)
+
+
+def test_compute_smoothed_firing_rates_dtype():
+    tt = np.linspace(0, 1, 101)
+
+    smoothed = compute_smoothed_firing_rates([np.array([.5])], tt, .05, dtype=np.float32)
+
+    assert smoothed.dtype == np.float32
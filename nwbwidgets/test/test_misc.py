@@ -4,10 +4,13 @@ import matplotlib.pyplot as plt
 from datetime import datetime
 from dateutil.tz import tzlocal
 from pynwb import NWBFile
+from pynwb.epoch import TimeIntervals
 from pynwb.misc import DecompositionSeries, AnnotationSeries
 from ipywidgets import widgets
 from nwbwidgets.misc import show_psth_raster, PSTHWidget, show_decomposition_traces, show_decomposition_series, RasterWidget, \
-    show_session_raster, show_annotations, RasterGridWidget, raster_grid
+    show_session_raster, show_annotations, RasterGridWidget, raster_grid, _group_mean_sem, \
+    _align_by_trials_cached, _get_label_inds
+import scipy.stats
 import unittest
 
 
@@ -16,6 +19,28 @@ def test_show_psth():
     assert isinstance(show_psth_raster(data=data, before=0, after=1), plt.Subplot)
 
 
+def test_group_mean_sem():
+    smoothed = np.random.random([9, 20])
+    group_inds = np.array([2, 0, 1, 0, 2, 0, 0, 1, 1])  # unequal groups of 4, 3 and 2
+
+    means, errs = _group_mean_sem(smoothed, group_inds)
+
+    for i, group in enumerate(np.unique(group_inds)):
+        np.testing.assert_allclose(means[i], np.mean(smoothed[group_inds == group], axis=0))
+        np.testing.assert_allclose(errs[i], scipy.stats.sem(smoothed[group_inds == group], axis=0), rtol=1e-6)
+
+
+def test_group_mean_sem_single_trial_group():
+    smoothed = np.random.random([4, 20])
+    group_inds = np.array([0, 0, 0, 1])
+
+    means, errs = _group_mean_sem(smoothed, group_inds)
+
+    np.testing.assert_allclose(means[1], smoothed[3])
+    assert np.all(np.isnan(errs[1]))
+    np.testing.assert_allclose(errs[0], scipy.stats.sem(smoothed[:3], axis=0), rtol=1e-6)
+
+
 def test_show_annotations():
     timestamps = np.array([0., 1., 2., 3., 4., 5., 6.])
     annotations = AnnotationSeries(name='test_annotations',timestamps=timestamps)
@@ -61,6 +86,19 @@ class ShowPSTHTestCase(unittest.TestCase):
     def test_show_session_raster(self):
         assert isinstance(show_session_raster(self.nwbfile.units), plt.Axes)
 
+    def test_align_by_trials_cached_order(self):
+        trials = self.nwbfile.trials
+        all_trials = _align_by_trials_cached(self.nwbfile.units, 1, trials, 'start_time', 0.5, 2.)
+        reordered = _align_by_trials_cached(self.nwbfile.units, 1, trials, 'start_time', 0.5, 2., order=[2, 0])
+
+        assert len(all_trials) == 3
+        np.testing.assert_array_equal(reordered[0], all_trials[2])
+        np.testing.assert_array_equal(reordered[1], all_trials[0])
+
+        # the same selection in another order is served from the cache
+        repeated = _align_by_trials_cached(self.nwbfile.units, 1, trials, 'start_time', 0.5, 2., order=[0, 2, 0])
+        assert repeated[0] is reordered[1] and repeated[1] is reordered[0] and repeated[2] is reordered[1]
+
     def test_raster_grid_widget(self):
         assert isinstance(RasterGridWidget(self.nwbfile.units), widgets.Widget)
 
@@ -68,6 +106,23 @@ class ShowPSTHTestCase(unittest.TestCase):
         trials = self.nwbfile.units.get_ancestor('NWBFile').trials
         assert isinstance(raster_grid(self.nwbfile.units, time_intervals=trials, index=0, before=0.5, after=20.0), plt.Figure)
 
+    def test_raster_grid_nan_label_and_trials_select(self):
+        time_intervals = TimeIntervals(name='Test Time Interval')
+        time_intervals.add_column(name='contrast', description='contrast of the stimulus')
+        for start_time, contrast in zip([1., 2., 3., 4., 5.], [.5, np.nan, 1., .5, .2]):
+            time_intervals.add_interval(start_time=start_time, stop_time=start_time + .5, contrast=contrast)
+        trials_select = np.array([True, True, True, True, False])
+
+        # the NaN trial and the unselected .2 trial do not get a row
+        urow_vals, row_inds = _get_label_inds(time_intervals, 'contrast', trials_select)
+        np.testing.assert_array_equal(urow_vals, [.5, 1.])
+        np.testing.assert_array_equal(row_inds, [0, -1, 1, 0, -1])
+
+        fig = raster_grid(self.nwbfile.units, time_intervals=time_intervals, index=0, before=0.5, after=1.,
+                          rows_label='contrast', trials_select=trials_select)
+        assert isinstance(fig, plt.Figure)
+        assert len(fig.axes) == 3  # two rows and the big ax for the labels
+
     
 class ShowDecompositionTestCase(unittest.TestCase):
 
@@ -1,7 +1,10 @@
+import gc
+
 import numpy as np
 from pynwb.core import DynamicTable
 from hdmf.common.table import VectorData
-from nwbwidgets.utils.dynamictable import infer_categorical_columns
+from nwbwidgets.utils.dynamictable import infer_categorical_columns, group_and_sort, get_soa, get_column_rows, \
+    has_variation, _table_cache
 
 
 
@@ -18,3 +21,67 @@ def test_infer_categorical_columns():
                              columns=vd,colnames=['Data1','Data2'])
     
     assert all(infer_categorical_columns(dynamic_table))==all({'Data1': np.array([1, 2, 3]), 'Data2': np.array([2, 3, 4])})
+
+
+def test_group_and_sort_limit():
+
+    group_vals = np.array(['a', 'b', 'b', 'a', 'a', 'b', 'b', 'c'])
+
+    order, group_inds, labels = group_and_sort(group_vals=group_vals, limit=2)
+
+    np.testing.assert_array_equal(order, [0, 3, 1, 2, 7])
+    np.testing.assert_array_equal(group_inds, [0, 0, 1, 1, 2])
+    np.testing.assert_array_equal(labels, ['a', 'b', 'c'])
+
+
+def test_get_soa():
+
+    data1 = np.array([1, 2, 2, 3])
+    vd1 = VectorData('Data1', 'vector data for creating a DynamicTable', data=data1)
+
+    dynamic_table = DynamicTable(name='test table', description='This is a test table',
+                                 columns=[vd1], colnames=['Data1'])
+
+    soa = get_soa(dynamic_table)
+    np.testing.assert_array_equal(soa['Data1'], data1)
+    assert get_soa(dynamic_table) is soa
+
+    # adding a row invalidates the cached arrays
+    dynamic_table.add_row(Data1=4)
+    np.testing.assert_array_equal(get_soa(dynamic_table)['Data1'], [1, 2, 2, 3, 4])
+
+    # the cache is released with the table
+    table_id = id(dynamic_table)
+    del dynamic_table, vd1, soa
+    gc.collect()
+    assert table_id not in _table_cache
+
+
+def test_get_column_rows():
+
+    data = np.arange(50) * 1.5
+    column = VectorData('Data1', 'vector data for creating a DynamicTable', data=data)
+
+    rows = [30, 3, 3, -1]  # few enough rows to only read the selected ones
+    np.testing.assert_array_equal(get_column_rows(column, rows), column[:][rows])
+
+    np.testing.assert_array_equal(get_column_rows(column), data)
+    np.testing.assert_array_equal(get_column_rows(column, data > 70), data[data > 70])
+    assert len(get_column_rows(column, [])) == 0
+
+
+def test_has_variation():
+
+    assert not has_variation(np.ones(1000))
+    assert not has_variation(np.array(['a'] * 1000))
+    assert not has_variation(np.ones(1))
+
+    middle = np.ones(1000)
+    middle[500] = 2  # outside the head and tail samples, so found only by the full check
+    assert has_variation(middle)
+
+    tail = np.ones(1000)
+    tail[-1] = 2
+    assert has_variation(tail)
+
+    assert has_variation(np.array([1, 2]))
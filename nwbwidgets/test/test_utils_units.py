@@ -5,7 +5,8 @@ from dateutil.tz import tzlocal
 from pynwb import NWBFile
 from ipywidgets import widgets
 from pynwb.epoch import TimeIntervals
-from nwbwidgets.utils.units import get_min_spike_time, align_by_trials, align_by_time_intervals
+from pynwb.misc import Units
+from nwbwidgets.utils.units import get_min_spike_time, get_max_spike_time, align_by_trials, align_by_time_intervals
 import unittest
 
 class ShowPSTHTestCase(unittest.TestCase):
@@ -38,6 +39,19 @@ class ShowPSTHTestCase(unittest.TestCase):
 
     def test_get_min_spike_time(self):
         assert(get_min_spike_time(self.nwbfile.units)==1.2)
+
+    def test_get_max_spike_time(self):
+        assert(get_max_spike_time(self.nwbfile.units)==26.0)
+
+    def test_get_spike_time_bounds_empty_units(self):
+        units = Units()
+        units.add_unit(spike_times=[])
+        units.add_unit(spike_times=[])
+        assert np.isnan(get_min_spike_time(units)) and np.isnan(get_max_spike_time(units))
+
+        units.add_unit(spike_times=[1.5, 2.5])
+        units.add_unit(spike_times=[])
+        assert get_min_spike_time(units) == 1.5 and get_max_spike_time(units) == 2.5
         
     def test_align_by_trials(self):
         ComparetoAT = [np.array([ 2.2,  3.0 , 25.0 , 26.0 ]),np.array([-0.8,  0. , 22. , 23. ]),
@@ -1,21 +1,142 @@
+from functools import wraps
+from weakref import finalize
+
 from pynwb.core import DynamicTable
+from hdmf.common.table import VectorIndex, DynamicTableRegion
 import numpy as np
 
+from .pynwb import robust_unique
+
+_table_cache = {}
+
+
+def memoize_by_table(fn):
+    """Cache the output of fn(dynamic_table) for as long as the table is alive. The cache is invalidated when
+    columns or rows are added to the table. Cached values are shared, so callers must not modify them in place.
+    Tables define __eq__ without __hash__, so entries are keyed on id(table) and dropped when the table is collected."""
+    @wraps(fn)
+    def memoized(dynamic_table):
+        key = (fn.__module__, fn.__qualname__)
+        state = (tuple(dynamic_table.colnames), len(dynamic_table))
+        table_cache = get_table_cache(dynamic_table)
+        if key not in table_cache or table_cache[key][0] != state:
+            table_cache[key] = (state, fn(dynamic_table))
+        return table_cache[key][1]
+    return memoized
+
+
+def get_table_cache(dynamic_table):
+    """Per-table cache dict, released when the table is garbage collected."""
+    table_id = id(dynamic_table)
+    if table_id not in _table_cache:
+        _table_cache[table_id] = {}
+        finalize(dynamic_table, _table_cache.pop, table_id, None)
+    return _table_cache[table_id]
+
+
+@memoize_by_table
+def get_soa(dynamic_table: DynamicTable):
+    """Structure-of-arrays view of a DynamicTable: each flat, 1-d column read once into a numpy array. Ragged
+    (indexed) columns and region columns are left out. The arrays are shared, so do not modify them in place.
+
+    Parameters
+    ----------
+    dynamic_table: DynamicTable
 
+    Returns
+    -------
+    dict of {str: np.ndarray}
+
+    """
+    soa = {}
+    for name in dynamic_table.colnames:
+        col = dynamic_table[name]
+        if isinstance(col, (VectorIndex, DynamicTableRegion)) or len(col.shape) != 1:
+            continue
+        soa[name] = np.asarray(col[:])
+    return soa
+
+
+@memoize_by_table
 def infer_categorical_columns(dynamic_table: DynamicTable):
 
     categorical_cols = {}
-    for name in dynamic_table.colnames:
-        if len(dynamic_table[name].shape) == 1:
-            try:  # TODO: fix this
-                unique_vals = np.unique(dynamic_table[name].data)
-                if 1 < len(unique_vals) <= (len(dynamic_table[name].data) / 2):
-                    categorical_cols[name] = unique_vals
-            except:
-                pass
+    for name, vals in get_soa(dynamic_table).items():
+        try:  # TODO: fix this
+            unique_vals = np.unique(vals)
+            if 1 < len(unique_vals) <= (len(vals) / 2):
+                categorical_cols[name] = unique_vals
+        except:
+            pass
     return categorical_cols
 
 
+@memoize_by_table
+def infer_orderable_columns(dynamic_table: DynamicTable):
+    soa = get_soa(dynamic_table)
+    # numbers and strings can be ordered. Strings read from HDF5 come back as object arrays
+    candidate_cols = [x for x in soa if soa[x].dtype.kind in 'biufcUS' or
+                      (soa[x].dtype == object and len(soa[x]) and isinstance(soa[x][0], str))]
+    return [x for x in candidate_cols if has_variation(soa[x])]
+
+
+def has_variation(col, sample=64):
+    """Whether a column holds more than one distinct value. The first and last few values are checked before the whole
+    column, so that most varying columns are accepted without a full unique.
+
+    Parameters
+    ----------
+    col: np.ndarray
+    sample: int, optional
+        Number of values to check at each end of the column
+
+    Returns
+    -------
+    bool
+
+    """
+    if len(col) < 2:
+        return False
+    head = col[:sample]
+    if len(robust_unique(head)) > 1:
+        return True
+    if len(robust_unique(np.concatenate([head, col[-sample:]]))) > 1:
+        return True
+    return len(col) > 2 * sample and len(robust_unique(col)) > 1
+
+
+def get_column_rows(column, rows=(), max_sparse_fraction=.1):
+    """Read selected rows of a column. When only a small fraction of the rows is selected, only those rows are read
+    from the underlying dataset instead of the whole column.
+
+    Parameters
+    ----------
+    column: VectorData
+    rows: array-like of int or bool, optional
+        Rows to read. Default () reads every row
+    max_sparse_fraction: float, optional
+        Largest fraction of selected rows for which only the selected rows are read
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    if isinstance(rows, tuple) and not rows:
+        return np.asarray(column[:])
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        rows = np.flatnonzero(rows)
+    else:
+        rows = rows.astype('int')
+    data = column.data
+    if 0 < len(rows) < max_sparse_fraction * len(data) and not isinstance(data, (list, tuple)):
+        # h5py only supports fancy indexing with strictly increasing, non-negative indices
+        unique_rows, inverse = np.unique(rows % len(data), return_inverse=True)
+        return np.asarray(data[unique_rows])[inverse.ravel()]
+    return np.asarray(column[:])[rows]
+
+
 def group_and_sort(group_vals=None, group_select=None, order_vals=None, discard_rows=None, limit=None):
     """
     Logical flow:
@@ -84,11 +205,13 @@ def group_and_sort(group_vals=None, group_select=None, order_vals=None, discard_
         _, group_inds = np.unique(group_inds, return_inverse=True)
 
     # apply limit
-    inds = list()
     if limit is not None:
         if group_inds is not None:
-            for i in range(len(labels)):
-                inds.extend(np.where(group_inds == i)[0][:limit])
+            # rank of each item within its group, keeping the original order inside each group
+            inds = np.argsort(group_inds, kind='stable')
+            sorted_group_inds = group_inds[inds]
+            rank = np.arange(len(inds)) - np.searchsorted(sorted_group_inds, sorted_group_inds)
+            inds = inds[rank < limit]
             order = order[inds]
             group_inds = group_inds[inds]
         else:
@@ -4,6 +4,8 @@ import pynwb
 from bisect import bisect_right, bisect_left
 from numpy import searchsorted
 
+from .dynamictable import get_column_rows, memoize_by_table
+
 
 def get_spike_times(units: pynwb.misc.Units, index, in_interval):
     """Use bisect methods to efficiently retrieve spikes from a given unit in a given interval
@@ -21,6 +23,34 @@ def get_spike_times(units: pynwb.misc.Units, index, in_interval):
     st = units['spike_times']
     unit_start = 0 if index == 0 else st.data[index - 1]
     unit_stop = st.data[index]
+
+    return _get_spike_times_in_range(st, unit_start, unit_stop, in_interval)
+
+
+def iter_spike_times(units: pynwb.misc.Units, indices, in_interval):
+    """Retrieve the spikes of several units in a given interval. The spike_times index is read once for all units
+    instead of twice per unit.
+
+    Parameters
+    ----------
+    units: pynwb.misc.Units
+    indices: array-like of int
+    in_interval: start and stop times
+
+    Yields
+    ------
+    np.ndarray of the spike times of each unit, in the order of indices
+
+    """
+    st = units['spike_times']
+    unit_stops = np.asarray(st.data[:])
+    unit_starts = np.r_[0, unit_stops[:-1]]
+
+    for index in indices:
+        yield _get_spike_times_in_range(st, int(unit_starts[index]), int(unit_stops[index]), in_interval)
+
+
+def _get_spike_times_in_range(st, unit_start, unit_stop, in_interval):
     start_time, stop_time = in_interval
 
     ind_start = bisect_left(st.target, start_time, unit_start, unit_stop)
@@ -40,10 +70,7 @@ def get_min_spike_time(units: pynwb.misc.Units):
     -------
 
     """
-    st = units['spike_times']
-    inds = [0] + list(st.data[:-1])
-    first_spikes = [st.target.data[i] for i in inds]
-    return np.min(first_spikes)
+    return get_spike_time_bounds(units)[0]
 
 
 def get_max_spike_time(units: pynwb.misc.Units):
@@ -56,11 +83,35 @@ def get_max_spike_time(units: pynwb.misc.Units):
     Returns
     -------
 
+    """
+    return get_spike_time_bounds(units)[1]
+
+
+@memoize_by_table
+def get_spike_time_bounds(units: pynwb.misc.Units):
+    """Retrieve the first and last spike times across all units in a single read. Spike times are sorted within each
+    unit, so only the first and last spike of each unit are needed. Cached per Units table. Returns (nan, nan) when
+    no unit has any spikes.
+
+    Parameters
+    ----------
+    units: pynwb.misc.Units
+
+    Returns
+    -------
+    (float, float)
+
     """
     st = units['spike_times']
-    inds = [x - 1 for x in st.data[:]]
-    last_spikes = [st.target.data[i] for i in inds]
-    return np.max(last_spikes)
+    unit_stops = np.asarray(st.data[:])
+    unit_starts = np.r_[0, unit_stops[:-1]]
+    nonempty = unit_stops > unit_starts
+    if not np.any(nonempty):
+        return np.nan, np.nan
+
+    first_and_last = get_column_rows(st.target, np.r_[unit_starts[nonempty], unit_stops[nonempty] - 1])
+    first_spikes, last_spikes = np.split(first_and_last, 2)
+    return np.min(first_spikes), np.max(last_spikes)
 
 
 def align_by_times(units: pynwb.misc.Units, index, starts, stops):
@@ -127,8 +178,8 @@ def align_by_time_intervals(units: pynwb.misc.Units, index, intervals, start_lab
     """
     if stop_label is None:
         stop_label = start_label
-    starts = np.array(intervals[start_label][:])[rows_select] - before
-    stops = np.array(intervals[stop_label][:])[rows_select] + after
+    starts = get_column_rows(intervals[start_label], rows_select) - before
+    stops = get_column_rows(intervals[stop_label], rows_select) + after
     if progress_bar is not None:
         progress_bar.value = 0
         progress_bar.description = 'reading spike data'